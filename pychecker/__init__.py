@@ -5,9 +5,16 @@ License: MIT
 """
 
 
-from . import *
-from .pychecker import *
-from . import __version__
+from .pychecker import (
+    check, PyCheckDebugger, NoAvailableSourceError, argument_to_string,
+    stderr_print, DEFAULT_PREFIX)
 from .builtins import install, uninstall
+from .__version__ import (
+    __title__, __license__, __version__, __author__, __contact__, __url__,
+    __description__)
 
-globals().update(dict((k, v) for k, v in __version__.__dict__.items()))
+__all__ = [
+    'check', 'PyCheckDebugger', 'NoAvailableSourceError', 'argument_to_string',
+    'stderr_print', 'DEFAULT_PREFIX', 'install', 'uninstall',
+    '__title__', '__license__', '__version__', '__author__', '__contact__',
+    '__url__', '__description__']
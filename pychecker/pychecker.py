@@ -6,28 +6,29 @@ License: MIT
 
 
 import ast
+import os
 import sys
-from textwrap import dedent
-from datetime import datetime
+import time
 from contextlib import contextmanager
 from os.path import basename, realpath
 import functools
 import pprint
+import reprlib
 import inspect
-import executing
-import colorama
-from pygments import highlight
-from pygments.formatters import Terminal256Formatter
-from pygments.lexers import PythonLexer, Python3Lexer
-from .coloring import SolarizedDark
+import weakref
 
 
 PYTHON2 = (sys.version_info[0] == 2)
 DEFAULT_PREFIX = 'check| '
 DEFAULT_LINE_WRAP_WIDTH = 70  # Characters.
 DEFAULT_CONTEXT_DELIMITER = '- '
+LIMITED_REPR_MAX_STRING = 200  # Characters.
+# Containers shortened to max_repr_size items when it is set.
+LIMITED_REPR_TYPES = frozenset((list, tuple, dict, set, frozenset))
 DEFAULT_ARG_TO_STRING_FUNCTION = pprint.pformat
+PFORMAT_WIDTH = 80  # Characters, pprint.pformat()'s default width.
 _absent = object()
+_NO_COLOR = os.environ.get('NO_COLOR') is not None
 
 
 class NoAvailableSourceError(OSError):
@@ -47,65 +48,158 @@ class NoAvailableSourceError(OSError):
         'or has the underlying source code changed at runtime?')
 
 
-class Source(executing.Source):
-    """
-    Processes the source code of the file and its associated metadata.
-    """
+ENABLE_VIRTUAL_TERMINAL_PROCESSING = 0x0004
+STD_ERROR_HANDLE = -12
 
-    def get_text_with_indentation(self, node):
-        """
-        Gets indented text
-        """
-        result = self.asttokens().get_text(node)
-        if '\n' in result:
-            result = ' ' * node.first_token.start[1] + result
-            result = dedent(result)
-        result = result.strip()
-        return result
 
+# Pygments and executing are slow to import, so they are only loaded
+# by _lazy_init() on first use. Until then these slots stay None.
+highlight = None
+Source = None
+_LEXER = None
+_FORMATTER = None
 
-def bind_static_variable(name, value):
+
+def _lazy_init():
+    """
+    Imports the heavy dependencies on first use
     """
-    Creating a decorator
+    global highlight, Source, _LEXER, _FORMATTER
+    if Source is not None:
+        return
+    if sys.platform == 'win32':
+        _enable_windows_terminal_colors()
+    from pygments import highlight
+    from pygments.formatters import Terminal256Formatter
+    from pygments.lexers import PythonLexer, Python3Lexer
+    from .coloring import SolarizedDark
+    from .source import Source as source_class
+    _LEXER = PythonLexer(ensurenl=False) if PYTHON2 else Python3Lexer(ensurenl=False)
+    _FORMATTER = Terminal256Formatter(style=SolarizedDark)
+    Source = source_class
+
+
+def _enable_windows_terminal_colors():
     """
-    def decorator(obj):
-        setattr(obj, name, value)
-        return obj
-    return decorator
+    Makes the Windows console interpret ANSI escape sequences.
+    Switches the console to virtual terminal mode (Windows 10+) and
+    falls back to wrapping the standard streams with colorama once.
+    Redirected streams are left alone, since output to them isn't
+    colorized anyway.
+    """
+    import ctypes
+    from ctypes import wintypes
+    kernel32 = ctypes.windll.kernel32
+    kernel32.GetStdHandle.restype = wintypes.HANDLE
+    handle = kernel32.GetStdHandle(STD_ERROR_HANDLE)
+    mode = wintypes.DWORD()
+    if (kernel32.GetConsoleMode(handle, ctypes.byref(mode)) and
+            kernel32.SetConsoleMode(
+                handle, mode.value | ENABLE_VIRTUAL_TERMINAL_PROCESSING)):
+        return
+    isatty = getattr(sys.stderr, 'isatty', None)
+    if isatty is None or not isatty():
+        return
+    import colorama
+    colorama.init()
+
+
+@functools.lru_cache(maxsize=256)
+def _colorize_cached(string):
+    _lazy_init()
+    return highlight(string, _LEXER, _FORMATTER)
 
 
-@bind_static_variable('formatter', Terminal256Formatter(style=SolarizedDark))
-@bind_static_variable('lexer', PythonLexer(ensurenl=False) if PYTHON2 else Python3Lexer(ensurenl=False))
 def colorize(string):
     """
     Implement the representation of the class SolarizedDark
     """
-    self = colorize
-    return highlight(string, self.lexer, self.formatter)
+    return _colorize_cached(string)
+
+
+# Parsed sources per filename and executing call nodes per code object
+# and last instruction, so that a check() in a loop only parses its file
+# and locates its call node once. Both are weak so that recompiled code,
+# like notebook cells or reloaded modules, doesn't pile up.
+_SOURCE_CACHE = weakref.WeakValueDictionary()
+_NODE_CACHE = weakref.WeakKeyDictionary()
+
+
+def _executing_node(call_frame):
+    """
+    Finds the call node currently executed in the frame
+    """
+    code = call_frame.f_code
+    nodes = _NODE_CACHE.get(code)
+    if nodes is None:
+        nodes = _NODE_CACHE[code] = {}
+    node = nodes.get(call_frame.f_lasti)
+    if node is None:
+        executing = Source.executing(call_frame)
+        node = executing.node
+        if node is not None:
+            nodes[call_frame.f_lasti] = node
+            _SOURCE_CACHE[code.co_filename] = executing.source
+    return node
+
+
+def _source_for_frame(call_frame):
+    """
+    Gets the parsed source of the file the frame is executing
+    """
+    filename = call_frame.f_code.co_filename
+    source = _SOURCE_CACHE.get(filename)
+    if source is None:
+        source = _SOURCE_CACHE[filename] = Source.for_frame(call_frame)
+    return source
+
+
+@functools.lru_cache(maxsize=256)
+def _context_path(filename, abs_path):
+    """
+    Gets the path of the file shown in the context
+    """
+    return realpath(filename) if abs_path else basename(filename)
 
 
 @contextmanager
 def support_terminal_colors_in_windows():
     """
-    Filter and replace ANSI escape sequences on Windows with equivalent Win32
-    API calls. This code does nothing on non-Windows systems.
+    Kept for backwards compatibility, does nothing.
+    Windows terminal colors are now set up once by _lazy_init().
     """
-    colorama.init()
     yield
-    colorama.deinit()
 
 
 def stderr_print(*args):
     """
     Prints std error
     """
-    print(*args, file=sys.stderr)
+    stream = sys.stderr
+    if stream is None:  # Like print(), under pythonw and windowed apps
+        return
+    if len(args) == 1:
+        stream.write(f'{args[0]}\n')
+    else:
+        stream.write(' '.join(map(str, args)) + '\n')
+
 
+# Characters a literal accepted by ast.literal_eval() can start with,
+# and the literals that look like names.
+_LITERAL_FIRST_CHARS = frozenset('0123456789\'"([{-+.bBrRuUfF')
+_LITERAL_KEYWORDS = frozenset(('True', 'False', 'None', 'set()'))
 
+
+@functools.lru_cache(maxsize=256)
 def is_literal(string):
     """
     Checks if the string consists of literals
     """
+    # Most arguments are plain names, for which literal_eval() would only
+    # raise, so rule them out without parsing.
+    if not string or (string[0] not in _LITERAL_FIRST_CHARS and
+                      string not in _LITERAL_KEYWORDS):
+        return False
     try:
         ast.literal_eval(string)
     except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
@@ -113,13 +207,22 @@ def is_literal(string):
     return True
 
 
+def _color_enabled():
+    isatty = getattr(sys.stderr, 'isatty', None)
+    return not _NO_COLOR and isatty is not None and isatty()
+
+
 def colorized_stderr_print(string):
     """
     Colors the std error print
+
+    Prints the plain string when std error is not a terminal
+    or the NO_COLOR environment variable is set.
     """
-    colored = colorize(string)
-    with support_terminal_colors_in_windows():
-        stderr_print(colored)
+    if not _color_enabled():
+        stderr_print(string)
+        return
+    stderr_print(colorize(string))
 
 
 DEFAULT_OUTPUT_FUNCTION = colorized_stderr_print
@@ -137,68 +240,91 @@ def prefix_lines_after_first(prefix, string):
     """
     Adds prefix lines
     """
-    lines = string.splitlines(True)
-    for i in range(1, len(lines)):
-        lines[i] = prefix + lines[i]
-    return ''.join(lines)
+    if string.isprintable():  # No line breaks
+        return string
+    first, *rest = string.splitlines(True)
+    return first + ''.join(prefix + line for line in rest)
 
 
 def indented_lines(prefix, string):
     """
     Adds indents
+
+    Prefixes the first line and aligns the following lines under it
     """
-    lines = string.splitlines()
-    return [prefix + lines[0]] + [' ' * len(prefix) + line for line in lines[1:]]
+    if string.isprintable():  # No line breaks
+        return prefix + string
+    return prefix + ('\n' + ' ' * len(prefix)).join(string.splitlines())
 
 
 def format_pair(prefix, arg, value):
     """
     Formatting argument-value pairs
     """
-    arg_lines = indented_lines(prefix, arg)
-    value_prefix = arg_lines[-1] + ': '
+    if arg.isprintable() and value.isprintable():
+        return f'{prefix}{arg}: {value}'
+    arg_lines, newline, last_arg_line = indented_lines(
+        prefix, arg).rpartition('\n')
     looks_like_a_string = value[0] + value[-1] in ["''", '""']
     if looks_like_a_string:  # Align the start of multiline strings
         value = prefix_lines_after_first(' ', value)
-    value_lines = indented_lines(value_prefix, value)
-    lines = arg_lines[:-1] + value_lines
-    return '\n'.join(lines)
+    value_lines = indented_lines(last_arg_line + ': ', value)
+    return f'{arg_lines}{newline}{value_lines}'
 
 
-def single_dispatch(func):
+@functools.singledispatch
+def argument_to_string(obj):
     """
-    Converting a function into a general function
+    Converts object to a string
     """
-    if "singledispatch" not in dir(functools):
-        def unsupported_py2(*args, **kwargs):
-            raise NotImplementedError(
-                "functools.singledispatch is missing in " + sys.version
-            )
-        func.register = func.unregister = unsupported_py2
-        return func
-    func = functools.singledispatch(func)
-    closure = dict(zip(func.register.__code__.co_freevars,
-                   func.register.__closure__))
-    registry = closure['registry'].cell_contents
-    dispatch_cache = closure['dispatch_cache'].cell_contents
+    string = DEFAULT_ARG_TO_STRING_FUNCTION(obj)
+    if '\\n' in string:
+        string = string.replace('\\n', '\n')
+    return string
 
-    def unregister(cls):
-        del registry[cls]
-        dispatch_cache.clear()
-    func.unregister = unregister
-    return func
 
+@argument_to_string.register(int)
+@argument_to_string.register(float)
+@argument_to_string.register(complex)
+@argument_to_string.register(type(None))
+def _scalar_to_string(obj):
+    """
+    Converts a number, bool or None to a string
 
-@single_dispatch
-def argument_to_string(obj):
+    pprint.pformat() returns the plain repr() of these
     """
-    Converts object to a string
+    return repr(obj)
+
+
+@argument_to_string.register(str)
+@argument_to_string.register(bytes)
+def _text_to_string(obj):
     """
-    string = DEFAULT_ARG_TO_STRING_FUNCTION(obj)
-    string = string.replace('\\n', '\n')
+    Converts a string or bytes to a string
+
+    pprint.pformat() only wraps reprs wider than its width, and only
+    escaped newlines need unescaping, so the rest get the plain repr()
+    """
+    string = repr(obj)
+    if len(string) > PFORMAT_WIDTH or '\\n' in string:
+        string = argument_to_string.dispatch(object)(obj)
     return string
 
 
+def _unregister_argument_to_string(cls):
+    """
+    Removes the implementation registered for the class
+    """
+    # singledispatch only exposes a read-only view of its registry.
+    register = argument_to_string.register
+    closure = dict(zip(register.__code__.co_freevars, register.__closure__))
+    del closure['registry'].cell_contents[cls]
+    argument_to_string._clear_cache()
+
+
+argument_to_string.unregister = _unregister_argument_to_string
+
+
 class PyCheckDebugger:
     """
     General class
@@ -213,22 +339,65 @@ class PyCheckDebugger:
     def __init__(self, prefix=DEFAULT_PREFIX,
                  output_function=DEFAULT_OUTPUT_FUNCTION,
                  arg_to_string_function=argument_to_string, include_context=False,
-                 context_abs_path=False):
+                 context_abs_path=False, max_repr_size=None):
         self.enabled = True
         self.prefix = prefix
         self.include_context = include_context
         self.output_function = output_function
         self.arg_to_string_function = arg_to_string_function
         self.context_abs_path = context_abs_path
+        self.max_repr_size = max_repr_size
+
+    @property
+    def prefix(self):
+        """
+        String or callable returning the string the output starts with
+        """
+        return self._prefix
+
+    @prefix.setter
+    def prefix(self, prefix):
+        self._prefix = prefix
+        # A callable prefix can change between calls, so only
+        # a string prefix is precomputed.
+        if callable(prefix):
+            self._prefix_str = self._prefix_pad = None
+        else:
+            self._prefix_str = prefix
+            self._prefix_pad = ' ' * len(prefix)
+
+    @property
+    def max_repr_size(self):
+        """
+        Maximum number of items shown for lists, tuples, dicts and sets,
+        or None to show them in full.
+        Only applies with the default arg_to_string_function;
+        arg_to_string_function=pprint.pformat always shows everything.
+        """
+        return self._max_repr_size
+
+    @max_repr_size.setter
+    def max_repr_size(self, max_repr_size):
+        self._max_repr_size = max_repr_size
+        if max_repr_size is None:
+            self._limited_repr = None
+            return
+        limited_repr = reprlib.Repr()
+        limited_repr.maxlist = limited_repr.maxtuple = max_repr_size
+        limited_repr.maxdict = max_repr_size
+        limited_repr.maxset = limited_repr.maxfrozenset = max_repr_size
+        limited_repr.maxstring = LIMITED_REPR_MAX_STRING
+        limited_repr.maxlong = limited_repr.maxother = LIMITED_REPR_MAX_STRING
+        self._limited_repr = limited_repr
 
     def __call__(self, *args):
         if self.enabled:
+            _lazy_init()
             call_frame = inspect.currentframe().f_back
-            try:
-                out = self._format(call_frame, *args)
-            except NoAvailableSourceError as err:
+            out, error = self._format_or_error(call_frame, *args)
+            if error is not None:
                 prefix = call_or_value(self.prefix)
-                out = prefix + 'Error: ' + err.infoMessage
+                out = prefix + 'Error: ' + error
             self.output_function(out)
         if not args:
             passthrough = None
@@ -242,29 +411,39 @@ class PyCheckDebugger:
         """
         Formats the received arguments
         """
+        _lazy_init()
         call_frame = inspect.currentframe().f_back
-        out = self._format(call_frame, *args)
+        out, error = self._format_or_error(call_frame, *args)
+        if error is not None:
+            raise NoAvailableSourceError()
         return out
 
-    def _format(self, call_frame, *args):
-        prefix = call_or_value(self.prefix)
+    def _format_or_error(self, call_frame, *args):
+        """
+        Returns the output and None, or None and the error message
+        when the source code of the call is not available
+        """
+        prefix = self._prefix_str
+        if prefix is None:
+            prefix = call_or_value(self.prefix)
 
-        call_node = Source.executing(call_frame).node
+        call_node = _executing_node(call_frame)
         if call_node is None:
-            raise NoAvailableSourceError()
-        context = self._format_context(call_frame, call_node)
+            return None, NoAvailableSourceError.infoMessage
         if not args:
+            context = self._format_context(call_frame, call_node)
             time = self._format_time()
             out = prefix + context + time
         else:
-            if not self.include_context:
-                context = ''
+            context = ''
+            if self.include_context:
+                context = self._format_context(call_frame, call_node)
             out = self._format_args(
                 call_frame, call_node, prefix, context, args)
-        return out
+        return out, None
 
     def _format_args(self, call_frame, call_node, prefix, context, args):
-        source = Source.for_frame(call_frame)
+        source = _source_for_frame(call_frame)
         sanitized_arg_strs = [
             source.get_text_with_indentation(arg)
             for arg in call_node.args]
@@ -272,10 +451,19 @@ class PyCheckDebugger:
         out = self._construct_argument_output(prefix, context, pairs)
         return out
 
+    def _limited_arg_to_string(self, obj):
+        # Handlers registered on argument_to_string take precedence.
+        cls = type(obj)
+        if (cls in LIMITED_REPR_TYPES and argument_to_string.dispatch(cls)
+                is argument_to_string.dispatch(object)):
+            return self._limited_repr.repr(obj)
+        return argument_to_string(obj)
+
     def _construct_argument_output(self, prefix, context, pairs):
-        def arg_prefix(arg):
-            return f'{arg}: '
-        pairs = [(arg, self.arg_to_string_function(val)) for arg, val in pairs]
+        to_string = self.arg_to_string_function
+        if self._limited_repr is not None and to_string is argument_to_string:
+            to_string = self._limited_arg_to_string
+        pairs = [(arg, to_string(val)) for arg, val in pairs]
         # For cleaner output, if <arg> is a literal, such as 3, 'string', b'bytes, etc.
         # output only the value, not the argument and value,
         # since the argument and value will be identical or nearly identical.
@@ -287,31 +475,36 @@ class PyCheckDebugger:
         #
         #   check| "hello": 'hello'.
         #
-        pair_strs = [
-            val if is_literal(arg) else (arg_prefix(arg) + val)
-            for arg, val in pairs]
-        all_args_on_one_line = self._pairDelimiter.join(pair_strs)
-        multiline_args = len(all_args_on_one_line.splitlines()) > 1
+        parts = []
+        delimiter = ''
+        for arg, val in pairs:
+            parts.append(delimiter)
+            if not is_literal(arg):
+                parts.append(f'{arg}: ')
+            parts.append(val)
+            delimiter = self._pairDelimiter
+        all_args_on_one_line = ''.join(parts)
         context_delimiter = self.context_delimiter if context else ''
-        all_pairs = prefix + context + context_delimiter + all_args_on_one_line
-        first_line_too_long = len(all_pairs.splitlines()[
-                                  0]) > self.lineWrapWidth
-        if multiline_args or first_line_too_long:
-            if context:
-                lines = [prefix + context] + [
-                    format_pair(len(prefix) * ' ', arg, value)
-                    for arg, value in pairs
-                ]
-            else:
-                arg_lines = [
-                    format_pair('', arg, value)
-                    for arg, value in pairs
-                ]
-                lines = indented_lines(prefix, '\n'.join(arg_lines))
-        else:
-            lines = [prefix + context +
-                     context_delimiter + all_args_on_one_line]
-        return '\n'.join(lines)
+        out = prefix + context + context_delimiter + all_args_on_one_line
+        # Printable strings hold no line breaks of any kind, which spares
+        # splitting the usual short output into lines.
+        if out.isprintable():
+            if len(out) <= self.lineWrapWidth:
+                return out
+        elif (len(all_args_on_one_line.splitlines()) <= 1 and
+              len(out.splitlines()[0]) <= self.lineWrapWidth):
+            return out
+        if context:
+            prefix_pad = self._prefix_pad
+            if prefix_pad is None:
+                prefix_pad = len(prefix) * ' '
+            lines = [f'{prefix}{context}']
+            lines.extend(
+                format_pair(prefix_pad, arg, value) for arg, value in pairs)
+            return '\n'.join(lines)
+        arg_lines = '\n'.join(
+            format_pair('', arg, value) for arg, value in pairs)
+        return indented_lines(prefix, arg_lines)
 
     def _format_context(self, call_frame, call_node):
         filename, line_number, parent_function = self._get_context(
@@ -322,17 +515,18 @@ class PyCheckDebugger:
         return context
 
     def _format_time(self):
-        now = datetime.now()
-        formatted = now.strftime('%H:%M:%S.%f')[:-3]
-        return f' at {formatted}'
+        now = time.time()
+        local = time.localtime(now)
+        milliseconds = int(now * 1000) % 1000
+        return (f' at {local.tm_hour:02d}:{local.tm_min:02d}:'
+                f'{local.tm_sec:02d}.{milliseconds:03d}')
 
     def _get_context(self, call_frame, call_node):
         line_number = call_node.lineno
-        frame_info = inspect.getframeinfo(call_frame)
-        parent_function = frame_info.function
+        code = call_frame.f_code
+        parent_function = code.co_name
 
-        filepath = (realpath if self.context_abs_path else basename)(
-            frame_info.filename)
+        filepath = _context_path(code.co_filename, self.context_abs_path)
         return filepath, line_number, parent_function
 
     def enable(self):
@@ -349,24 +543,29 @@ class PyCheckDebugger:
 
     def configure_output(self, prefix=_absent, output_function=_absent,
                          arg_to_string_function=_absent, include_context=_absent,
-                         context_abs_path=_absent):
+                         context_abs_path=_absent, max_repr_size=_absent):
         """
         Configures the output
         """
-        no_parameter_provided = all(
-            v is _absent for k, v in locals().items() if k != 'self')
+        no_parameter_provided = (
+            prefix is _absent and output_function is _absent and
+            arg_to_string_function is _absent and include_context is _absent and
+            context_abs_path is _absent and max_repr_size is _absent)
         if no_parameter_provided:
             raise TypeError('configure_output() missing at least one argument')
         if prefix is not _absent:
             self.prefix = prefix
         if output_function is not _absent:
             self.output_function = output_function
+            _colorize_cached.cache_clear()
         if arg_to_string_function is not _absent:
             self.arg_to_string_function = arg_to_string_function
         if include_context is not _absent:
             self.include_context = include_context
         if context_abs_path is not _absent:
             self.context_abs_path = context_abs_path
+        if max_repr_size is not _absent:
+            self.max_repr_size = max_repr_size
 
 
 check = PyCheckDebugger()
@@ -0,0 +1,39 @@
+"""
+Source code inspection for check() calls
+
+Imported lazily by pychecker on the first check() call, since executing
+and asttokens are expensive to import.
+"""
+
+
+from textwrap import dedent
+import executing
+
+
+class Source(executing.Source):
+    """
+    Processes the source code of the file and its associated metadata.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Nodes belong to this source's tree and live as long as it does,
+        # so their ids are stable keys.
+        self._text_cache = {}
+
+    def get_text_with_indentation(self, node):
+        """
+        Gets indented text
+        """
+        result = self._text_cache.get(id(node))
+        if result is None:
+            result = self._text_cache[id(node)] = self._get_text_with_indentation(node)
+        return result
+
+    def _get_text_with_indentation(self, node):
+        result = self.asttokens().get_text(node)
+        if '\n' in result:
+            result = ' ' * node.first_token.start[1] + result
+            result = dedent(result)
+        result = result.strip()
+        return result
@@ -4,6 +4,7 @@ Running tests and publishing to PyPI
 
 
 import os
+import sys
 from pychecker import *
 from os.path import dirname, join
 from setuptools.command.test import test
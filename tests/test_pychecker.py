@@ -4,6 +4,7 @@ pychecker — Never use print() to debug again
 License: MIT
 """
 
+import re
 import sys
 import unittest
 import functools
@@ -12,142 +13,219 @@ from contextlib import contextmanager
 from os.path import basename, splitext, realpath
 from pychecker import check, argument_to_string, stderr_print, NoAvailableSourceError
 
-try:  # Python 2.x.
-    from StringIO import StringIO
-except ImportError:  # Python 3.x.
-    from io import StringIO
-
 
 TEST_PAIR_DELIMITER = '| '
 MY_FILENAME = basename(__file__)
 MY_FILEPATH = realpath(__file__)
+MY_NAME = splitext(MY_FILENAME)[0]
+MY_PATH = splitext(MY_FILEPATH)[0]
+PYTHON_EXTENSIONS = frozenset(('.py', '.pyc', '.pyo'))
+# An argument, optionally followed by ':' and its value, up to the next delimiter.
+PAIR_RE = re.compile(r'((?:(?!{0})[^:])+)(?::((?:(?!{0}).)*))?(?:{0}|$)'.format(
+    re.escape(TEST_PAIR_DELIMITER)))
+CONTEXT_RE = re.compile(
+    r'^(?P<file>.+):(?P<lineno>[1-9]\d*) in (?P<func><module>|.+\(\))$')
+CONTEXT_AND_TIME_RE = re.compile(
+    r'^(?P<context>.+) at \d\d:\d\d:\d\d\.\d+$')
 
 a = 1
 b = 2
 c = 3
 
+# Expected output of testMultilineContainerArgs.
+MULTILINE_CONTAINER_OUTPUT = """
+        check| (a, b): (1, 2)
+        check| [a, b]: [1, 2]
+        check| (a, b): (1, 2)
+        [list(range(15)), list(range(15))]:
+        [[0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14],
+        [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14]]
+        """.strip()
+MULTILINE_CONTAINER_CONTEXT_RE = re.compile(
+    r'ic\| test_pychecker.py:\d+ in testMultilineContainerArgs\(\)')
+MULTILINE_CONTAINER_OUTPUT_WITH_CONTEXT = """\
+        (a, b): (1, 2)
+        [list(range(15)), list(range(15))]:
+        [[0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14],
+        [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14]]"""
+
 
 def noop(*args, **kwargs):
     return
 
 
-def has_ansi_escape_codes(s):
-    return '\x1b[' in s
-
-
-class FakeTeletypeBuffer(StringIO):
+class FakeTeletypeBuffer:
     """
-    Extend StringIO to act like a TTY so ANSI control codes aren't stripped
+    Text sink that acts like a TTY so ANSI control codes aren't stripped
     when wrapped with colorama's wrap_stream().
+    Writes into a preallocated UTF-8 buffer that doubles when full,
+    and keeps the written text split into lines as it goes, the same
+    way str.splitlines() splits getvalue().
     """
+    __slots__ = ('_buf', '_pos', '_lines', '_line_buf')
+
+    def __init__(self, capacity=4096):
+        self._buf = bytearray(capacity)
+        self._pos = 0
+        self._lines = []
+        self._line_buf = ''
+
+    def write(self, s):
+        data = s.encode('utf-8')
+        end = self._pos + len(data)
+        if end > len(self._buf):
+            self._buf.extend(bytes(max(end, 2 * len(self._buf)) - len(self._buf)))
+        self._buf[self._pos:end] = data
+        self._pos = end
+        if s.isprintable():  # No line breaks
+            self._line_buf += s
+            return len(s)
+        parts = (self._line_buf + s).splitlines(True)
+        # Hold back an unfinished last line, and a trailing '\r' since
+        # the next write may start with the '\n' of a '\r\n'.
+        last = parts[-1] if parts else ''
+        if last.endswith('\r') or last.splitlines() == [last]:
+            self._line_buf = parts.pop()
+        else:
+            self._line_buf = ''
+        self._lines.extend(line.splitlines()[0] for line in parts)
+        return len(s)
+
+    def flush(self):
+        pass
 
     def isatty(self):
         return True
 
+    def reset(self):
+        self._pos = 0
+        self._lines = []
+        self._line_buf = ''
 
-@contextmanager
-def disable_coloring():
-    original_output_function = check.output_function
-    check.configureOutput(outputFunction=stderr_print)
-    yield
-    check.configureOutput(outputFunction=original_output_function)
+    def getvalue(self):
+        return self._buf[:self._pos].decode('utf-8')
+
+    def has_ansi_escape_codes(self):
+        return self._buf.find(b'\x1b[', 0, self._pos) != -1
+
+    def lines(self):
+        if self._line_buf:
+            return self._lines + self._line_buf.splitlines()
+        return self._lines[:]
+
+    splitlines = lines
+
+
+# Reused by every capture, so each test only resets their cursors.
+_STDOUT_BUF = FakeTeletypeBuffer()
+_STDERR_BUF = FakeTeletypeBuffer()
+# Output collected by tests, cleared before use to keep its capacity.
+_SCRATCH_LIST = []
 
 
 @contextmanager
 def configure_pychecker_output(prefix=None, outputFunction=None,
                                argToStringFunction=None, includeContext=None,
                                contextAbsPath=None):
-    old_prefix = check.prefix
-    old_output_function = check.outputFunction
-    old_arg_to_string_function = check.arg_to_string_function
-    old_include_context = check.include_context
-    old_context_abs_path = check.context_abs_path
-    if prefix:
-        check.configure_output(prefix=prefix)
-    if outputFunction:
-        check.configure_output(outputFunction=outputFunction)
-    if argToStringFunction:
-        check.configure_output(argToStringFunction=argToStringFunction)
-    if includeContext:
-        check.configure_output(includeContext=includeContext)
-    if contextAbsPath:
-        check.configure_output(contextAbsPath=contextAbsPath)
-    yield
-    check.configure_output(
-        old_prefix, old_output_function, old_arg_to_string_function,
-        old_include_context, old_context_abs_path)
+    snapshot = (
+        check.prefix, check.output_function, check.arg_to_string_function,
+        check.include_context, check.context_abs_path)
+    kwargs = {k: v for k, v in (
+        ('prefix', prefix), ('output_function', outputFunction),
+        ('arg_to_string_function', argToStringFunction),
+        ('include_context', includeContext),
+        ('context_abs_path', contextAbsPath)) if v is not None}
+    try:
+        if kwargs:
+            check.configure_output(**kwargs)
+        yield
+    finally:
+        check.configure_output(*snapshot)
 
 
 @contextmanager
 def capture_standard_streams():
     real_stdout = sys.stdout
     real_stderr = sys.stderr
-    new_stdout = FakeTeletypeBuffer()
-    new_stderr = FakeTeletypeBuffer()
+    _STDOUT_BUF.reset()
+    _STDERR_BUF.reset()
+    try:
+        sys.stdout = _STDOUT_BUF
+        sys.stderr = _STDERR_BUF
+        yield _STDOUT_BUF, _STDERR_BUF
+    finally:
+        sys.stdout = real_stdout
+        sys.stderr = real_stderr
+
+
+@contextmanager
+def captured():
+    """
+    Captures the standard streams with check() printing without colors
+    """
+    real_stdout = sys.stdout
+    real_stderr = sys.stderr
+    original_output_function = check.output_function
+    _STDOUT_BUF.reset()
+    _STDERR_BUF.reset()
     try:
-        sys.stdout = new_stdout
-        sys.stderr = new_stderr
-        yield new_stdout, new_stderr
+        sys.stdout = _STDOUT_BUF
+        sys.stderr = _STDERR_BUF
+        check.output_function = stderr_print
+        yield _STDOUT_BUF, _STDERR_BUF
     finally:
+        check.output_function = original_output_function
         sys.stdout = real_stdout
         sys.stderr = real_stderr
 
 
-def strip_prefix(line):
-    if line.startswith(check.prefix):
-        line = line.strip()[len(check.prefix):]
+def strip_prefix(line, prefix=None):
+    prefix = prefix or check.prefix
+    if line.startswith(prefix):
+        line = line.strip()[len(prefix):]
     return line
 
 
-def line_is_context_and_time(line):
-    line = strip_prefix(line)
-    context, time = line.split(' at ')
-    return (
-        line_is_context(context) and
-        len(time.split(':')) == 3 and
-        len(time.split('.')) == 2)
+def line_is_context_and_time(line, prefix=None):
+    if ' at ' not in line:
+        return False
+    prefix = prefix or check.prefix
+    m = CONTEXT_AND_TIME_RE.match(strip_prefix(line, prefix))
+    return m is not None and line_is_context(m['context'], prefix)
 
 
-def line_is_context(line):
-    line = strip_prefix(line)
-    source_location, function = line.split(' in ')
-    filename, line_number = source_location.split(':')
-    name, ext = splitext(filename)
-    return (
-        int(line_number) > 0 and
-        ext in ['.py', '.pyc', '.pyo'] and
-        name == splitext(MY_FILENAME)[0] and
-        (function == '<module>' or function.endswith('()')))
+def line_is_context(line, prefix=None):
+    if ' in ' not in line:
+        return False
+    m = CONTEXT_RE.match(strip_prefix(line, prefix))
+    if m is None:
+        return False
+    name, ext = splitext(m['file'])
+    return ext in PYTHON_EXTENSIONS and name == MY_NAME
 
 
-def line_is_abs_path_context(line):
-    line = strip_prefix(line)
-    source_location, function = line.split(' in ')
-    filepath, line_number = source_location.split(':')
-    path, ext = splitext(filepath)
-    return (
-        int(line_number) > 0 and
-        ext in ['.py', '.pyc', '.pyo'] and
-        path == splitext(MY_FILEPATH)[0] and
-        (function == '<module>' or function.endswith('()')))
+def line_is_abs_path_context(line, prefix=None):
+    if ' in ' not in line:
+        return False
+    m = CONTEXT_RE.match(strip_prefix(line, prefix))
+    if m is None:
+        return False
+    path, ext = splitext(m['file'])
+    return ext in PYTHON_EXTENSIONS and path == MY_PATH
 
 
 def line_after_context(line, prefix):
     if line.startswith(prefix):
         line = line[len(prefix):]
-    toks = line.split(' in ', 1)
-    if len(toks) == 2:
-        rest = toks[1].split(' ')
-        line = ' '.join(rest[1:])
+    _, sep, function_and_rest = line.partition(' in ')
+    if sep:
+        line = function_and_rest.partition(' ')[2]
     return line
 
 
 def parse_output_into_pairs(out, err, assertNumLines,
                             prefix=pychecker.DEFAULT_PREFIX):
-    if isinstance(out, StringIO):
-        out = out.getvalue()
-    if isinstance(err, StringIO):
-        err = err.getvalue()
+    out = getattr(out, 'getvalue', lambda: out)()
     assert not out
     lines = err.splitlines()
     if assertNumLines:
@@ -158,20 +236,20 @@ def parse_output_into_pairs(out, err, assertNumLines,
         if not line:
             line_pairs.append([])
             continue
-        pair_strs = line.split(TEST_PAIR_DELIMITER)
-        pairs = [tuple(s.split(':', 1)) for s in pair_strs]
+        pairs = [m.groups() for m in PAIR_RE.finditer(line)]
         # Indented line of a multiline value
-        if len(pairs[0]) == 1 and line.startswith(' '):
+        if pairs[0][1] is None and line.startswith(' '):
             arg, value = line_pairs[-1][-1]
-            looks_like_a_string = value[0] in ["'", '"']
-            prefix = (arg + ': ') + (' ' if looks_like_a_string else '')
-            dedented = line[len(check.prefix) + len(prefix):]
+            looks_like_a_string = value[:1] in ("'", '"')
+            # Skip the prefix, '<arg>: ' and a string's opening quote.
+            offset = len(prefix) + len(arg) + 2 + (1 if looks_like_a_string else 0)
+            dedented = line[offset:]
             line_pairs[-1][-1] = (arg, value + '\n' + dedented)
         else:
             items = [
-                (p[0].strip(), None) if len(p) == 1  # A value, like check(3)
-                else (p[0].strip(), p[1].strip())  # A variable, like check(a)
-                for p in pairs]
+                (arg.strip(), None) if value is None  # A value, like check(3)
+                else (arg.strip(), value.strip())  # A variable, like check(a)
+                for arg, value in pairs]
             line_pairs.append(items)
     return line_pairs
 
@@ -180,9 +258,55 @@ def foo():
     return 'foo'
 
 
+class TestOutputParsers(unittest.TestCase):
+    def testFakeTeletypeBufferLines(self):
+        writes = [
+            ['a\rb\n'], ['a\n', 'b'], ['a\r', '\nb\n'], ['a b', '\x0cc'],
+            ['\n\n'], ['x\ty']]
+        for chunks in writes:
+            buf = FakeTeletypeBuffer()
+            for chunk in chunks:
+                buf.write(chunk)
+            assert buf.lines() == buf.getvalue().splitlines(), chunks
+
+    def testStripPrefix(self):
+        assert strip_prefix('check| a: 1') == 'a: 1'
+        assert strip_prefix('a: 1') == 'a: 1'
+
+    def testLineIsContext(self):
+        assert line_is_context('check| test_pychecker.py:3 in foo()')
+        assert line_is_context('check| test_pychecker.py:3 in <module>')
+        assert not line_is_context('check| other.py:3 in foo()')
+        assert not line_is_context('check| test_pychecker.py:0 in foo()')
+        assert not line_is_context('check| a: 1')
+
+    def testLineIsAbsPathContext(self):
+        assert line_is_abs_path_context(f'check| {MY_FILEPATH}:3 in foo()')
+        assert not line_is_abs_path_context('check| test_pychecker.py:3 in foo()')
+
+    def testLineIsContextAndTime(self):
+        assert line_is_context_and_time(
+            'check| test_pychecker.py:3 in foo() at 01:02:03.456')
+        assert not line_is_context_and_time('check| test_pychecker.py:3 in foo()')
+
+    def testLineAfterContext(self):
+        prefix = 'check| '
+        assert line_after_context(
+            'check| test_pychecker.py:3 in foo()- a: 1', prefix) == 'a: 1'
+        assert line_after_context('check| a: 1', prefix) == 'a: 1'
+
+    def testParseOutputIntoPairs(self):
+        err = "check| a: 1| 'b'| c: {1: 'x'}\ncheck| s: 'line1\n           line2'"
+        assert parse_output_into_pairs('', err, 3) == [
+            [('a', '1'), ("'b'", None), ('c', "{1: 'x'}")],
+            [('s', "'line1\nline2'")]]
+
+
 class TestPyChecker(unittest.TestCase):
     def setUp(self):
-        check._pair_delimiter = TEST_PAIR_DELIMITER
+        check._pairDelimiter = TEST_PAIR_DELIMITER
+        self._arg2str = check.arg_to_string_function
+        self._fmt = check.format
 
     def testMetadata(self):
         def is_non_empty_string(s):
@@ -196,64 +320,81 @@ class TestPyChecker(unittest.TestCase):
         assert is_non_empty_string(pychecker.__url__)
 
     def testWithoutArgs(self):
-        with disable_coloring(), capture_standard_streams() as (out, err):
+        with captured() as (out, err):
             check()
         assert line_is_context_and_time(err.getvalue())
 
     def testAsArgument(self):
-        with disable_coloring(), capture_standard_streams() as (out, err):
+        with captured() as (out, err):
             noop(check(a), check(b))
         pairs = parse_output_into_pairs(out, err, 2)
         assert pairs[0][0] == ('a', '1') and pairs[1][0] == ('b', '2')
-        with disable_coloring(), capture_standard_streams() as (out, err):
+        with captured() as (out, err):
             dic = {1: check(a)}  # noqa
             lst = [check(b), check()]  # noqa
         pairs = parse_output_into_pairs(out, err, 3)
         assert pairs[0][0] == ('a', '1')
         assert pairs[1][0] == ('b', '2')
-        assert line_is_context_and_time(err.getvalue().splitlines()[-1])
+        assert line_is_context_and_time(err.splitlines()[-1])
 
-    def testSingleArgument(self):
-        with disable_coloring(), capture_standard_streams() as (out, err):
-            check(a)
-        assert parse_output_into_pairs(out, err, 1)[0][0] == ('a', '1')
+    def testArguments(self):
+        class AttrClass:
+            attr = 'yep'
 
-    def testMultipleArguments(self):
-        with disable_coloring(), capture_standard_streams() as (out, err):
-            check(a, b)
-        pairs = parse_output_into_pairs(out, err, 1)[0]
-        assert pairs == [('a', '1'), ('b', '2')]
+        class Symbol:
+            def __init__(self, name):
+                self.name = name
+
+            def __repr__(self):
+                return self.name
+
+        class R:
+            def __repr__(self):
+                return 'R()'
+
+        d = {'d': {1: 'one'}, 'k': AttrClass}
+        inf = float('inf')
+        x = Symbol('x')
+        bar = Symbol('bar')
+        cases = [
+            ('single', lambda: check(a), [('a', '1')]),
+            ('multiple', lambda: check(a, b), [('a', '1'), ('b', '2')]),
+            ('values', lambda: check(3, 'asdf', "asdf"),
+             [('3', None), ("'asdf'", None), ("'asdf'", None)]),
+            ('tuple', lambda: check((a, b)), [('(a, b)', '(1, 2)')]),
+            ('tuples', lambda: check((a, b), (b, a), a, b),
+             [('(a, b)', '(1, 2)'), ('(b, a)', '(2, 1)'), ('a', '1'), ('b', '2')]),
+            ('subscript', lambda: check(d['d'][1]), [("d['d'][1]", "'one'")]),
+            ('attribute', lambda: check(d['k'].attr), [("d['k'].attr", "'yep'")]),
+            ('name matching its repr', lambda: check(inf, x, bar),
+             [('inf', 'inf'), ('x', 'x'), ('bar', 'bar')]),
+            ('expression matching its repr', lambda: check(-inf, [inf], R()),
+             [('-inf', '-inf'), ('[inf]', '[inf]'), ('R()', 'R()')]),
+        ]
+        for name, call, expected in cases:
+            with self.subTest(name):
+                with captured() as (out, err):
+                    call()
+                pairs = parse_output_into_pairs(out, err, 1)[0]
+                self.assertEqual(pairs, expected)
 
     def testNestedMultiline(self):
-        with disable_coloring(), capture_standard_streams() as (out, err):
+        with captured() as (out, err):
             check(
             )
         assert line_is_context_and_time(err.getvalue())
-        with disable_coloring(), capture_standard_streams() as (out, err):
+        with captured() as (out, err):
             check(a,
                   'foo')
         pairs = parse_output_into_pairs(out, err, 1)[0]
         assert pairs == [('a', '1'), ("'foo'", None)]
-        with disable_coloring(), capture_standard_streams() as (out, err):
+        with captured() as (out, err):
             noop(noop(noop({1: check(
                 noop())})))
         assert parse_output_into_pairs(out, err, 1)[0][0] == ('noop()', 'None')
 
-    def testExpressionArguments(self):
-        class AttrClass:
-            attr = 'yep'
-        d = {'d': {1: 'one'}, 'k': AttrClass}
-        with disable_coloring(), capture_standard_streams() as (out, err):
-            check(d['d'][1])
-        pair = parse_output_into_pairs(out, err, 1)[0][0]
-        assert pair == ("d['d'][1]", "'one'")
-        with disable_coloring(), capture_standard_streams() as (out, err):
-            check(d['k'].attr)
-        pair = parse_output_into_pairs(out, err, 1)[0][0]
-        assert pair == ("d['k'].attr", "'yep'")
-
     def testMultipleCallsOnSameLine(self):
-        with disable_coloring(), capture_standard_streams() as (out, err):
+        with captured() as (out, err):
             check(a)
             check(b, c)  # noqa
         pairs = parse_output_into_pairs(out, err, 2)
@@ -261,14 +402,14 @@ class TestPyChecker(unittest.TestCase):
         assert pairs[1] == [('b', '2'), ('c', '3')]
 
     def testCallSurroundedByExpressions(self):
-        with disable_coloring(), capture_standard_streams() as (out, err):
+        with captured() as (out, err):
             noop()
             check(a)
             noop()  # noqa
         assert parse_output_into_pairs(out, err, 1)[0][0] == ('a', '1')
 
     def testComments(self):
-        with disable_coloring(), capture_standard_streams() as (out, err):
+        with captured() as (out, err):
             """Comment."""
             check()  # noqa
         assert line_is_context_and_time(err.getvalue())
@@ -277,13 +418,13 @@ class TestPyChecker(unittest.TestCase):
         class Foo:
             pass
         f = Foo()
-        with disable_coloring(), capture_standard_streams() as (out, err):
+        with captured() as (out, err):
             check(foo())
         assert parse_output_into_pairs(
             out, err, 1)[0][0] == ('f.foo()', "'foo'")
 
     def testComplicated(self):
-        with disable_coloring(), capture_standard_streams() as (out, err):
+        with captured() as (out, err):
             noop()
             check()
             noop()
@@ -292,24 +433,24 @@ class TestPyChecker(unittest.TestCase):
                noop())
             noop()  # noqa
         pairs = parse_output_into_pairs(out, err, 2)
-        assert line_is_context_and_time(err.getvalue().splitlines()[0])
+        assert line_is_context_and_time(err.splitlines()[0])
         assert pairs[1] == [
             ('a', '1'), ('b', '2'), ('noop.__class__.__name__', "'function'"),
             ('noop ()', 'None')]
 
     def testReturnValue(self):
-        with disable_coloring(), capture_standard_streams() as (out, err):
+        with captured() as (out, err):
             assert check() is None
             assert check(1) == 1
             assert check(1, 2, 3) == (1, 2, 3)
 
     def testDifferentName(self):
         from pychecker import check as foo
-        with disable_coloring(), capture_standard_streams() as (out, err):
+        with captured() as (out, err):
             foo()
         assert line_is_context_and_time(err.getvalue())
         newname = foo
-        with disable_coloring(), capture_standard_streams() as (out, err):
+        with captured() as (out, err):
             newname(a)
         pair = parse_output_into_pairs(out, err, 1)[0][0]
         assert pair == ('a', '1')
@@ -317,7 +458,7 @@ class TestPyChecker(unittest.TestCase):
     def testPrefixConfiguration(self):
         prefix = 'lolsup '
         with configure_pychecker_output(prefix, stderr_print):
-            with disable_coloring(), capture_standard_streams() as (out, err):
+            with captured() as (out, err):
                 check(a)
         pair = parse_output_into_pairs(out, err, 1, prefix=prefix)[0][0]
         assert pair == ('a', '1')
@@ -326,14 +467,15 @@ class TestPyChecker(unittest.TestCase):
             return 'lolsup '
 
         with configure_pychecker_output(prefix=prefix_function):
-            with disable_coloring(), capture_standard_streams() as (out, err):
+            with captured() as (out, err):
                 check(b)
         pair = parse_output_into_pairs(
             out, err, 1, prefix=prefix_function())[0][0]
         assert pair == ('b', '2')
 
     def testOutputFunction(self):
-        lst = []
+        lst = _SCRATCH_LIST
+        lst.clear()
 
         def append_to(s):
             lst.append(s)
@@ -349,8 +491,17 @@ class TestPyChecker(unittest.TestCase):
         pairs = parse_output_into_pairs(out, '\n'.join(lst), 2)
         assert pairs == [[('a', '1')], [('b', '2')]]
 
+    def testStderrPrintWithoutStderr(self):
+        # sys.stderr is None under pythonw, where print() does nothing
+        real_stderr = sys.stderr
+        sys.stderr = None
+        try:
+            stderr_print('check| a: 1')
+        finally:
+            sys.stderr = real_stderr
+
     def testEnableDisable(self):
-        with disable_coloring(), capture_standard_streams() as (out, err):
+        with captured() as (out, err):
             assert check(a) == 1
             assert check.enabled
             check.disable()
@@ -367,12 +518,33 @@ class TestPyChecker(unittest.TestCase):
             return 'zwei'
 
         with configure_pychecker_output(argToStringFunction=hello):
-            with disable_coloring(), capture_standard_streams() as (out, err):
+            with captured() as (out, err):
                 eins = 'ein'
                 check(eins)
         pair = parse_output_into_pairs(out, err, 1)[0][0]
         assert pair == ('eins', 'zwei')
 
+    def testMaxReprSize(self):
+        lst = list(range(50))
+        check.configure_output(max_repr_size=5)
+        try:
+            s = self._fmt(lst)
+        finally:
+            check.configure_output(max_repr_size=None)
+        assert s == check.prefix + 'lst: [0, 1, 2, 3, 4, ...]'
+        assert '...' not in self._fmt(lst)
+
+    def testMaxReprSizeKeepsRegisteredHandlers(self):
+        t = (1, 2)
+        argument_to_string.register(tuple, lambda obj: 'CUSTOM')
+        check.configure_output(max_repr_size=5)
+        try:
+            s = self._fmt(t)
+        finally:
+            check.configure_output(max_repr_size=None)
+            argument_to_string.unregister(tuple)
+        assert s == check.prefix + 't: CUSTOM'
+
     def testSingledispatchArgument_to_string(self):
         def argument_to_string_tuple(obj):
             return "Dispatching tuple!"
@@ -386,54 +558,71 @@ class TestPyChecker(unittest.TestCase):
             return
         # Prepare input and output
         x = (1, 2)
-        default_output = check.format(x)
+        default_output = self._fmt(x)
         # Register
         argument_to_string.register(tuple, argument_to_string_tuple)
         assert tuple in argument_to_string.registry
-        assert str.endswith(check.format(x), argument_to_string_tuple(x))
+        assert str.endswith(self._fmt(x), argument_to_string_tuple(x))
         # Unregister
         argument_to_string.unregister(tuple)
         assert tuple not in argument_to_string.registry
-        assert check.format(x) == default_output
+        assert self._fmt(x) == default_output
 
     def testSingleArgumentLongLineNotWrapped(self):
         # A single long line with one argument is not line wrapped
         long_str = '*' * (check.lineWrapWidth + 1)
-        with disable_coloring(), capture_standard_streams() as (out, err):
+        with captured() as (out, err):
             check(long_str)
         pair = parse_output_into_pairs(out, err, 1)[0][0]
         assert len(err.getvalue()) > check.lineWrapWidth
-        assert pair == ('long_str', check.argToStringFunction(long_str))
+        assert pair == ('long_str', self._arg2str(long_str))
 
     def testMultipleArgumentsLongLineWrapped(self):
         # A single long line with multiple variables is line wrapped
-        val = '*' * int(check.lineWrapWidth / 4)
-        val_str = check.argToStringFunction(val)
+        prefix = check.prefix
+        line_wrap_width = check.lineWrapWidth
+        val = '*' * int(line_wrap_width / 4)
+        val_str = self._arg2str(val)
         v1 = v2 = v3 = v4 = val
-        with disable_coloring(), capture_standard_streams() as (out, err):
+        with captured() as (out, err):
             check(v1, v2, v3, v4)
         pairs = parse_output_into_pairs(out, err, 4)
         assert pairs == [[(k, val_str)] for k in ['v1', 'v2', 'v3', 'v4']]
-        lines = err.getvalue().splitlines()
+        lines = err.splitlines()
+        prefix_pad = ' ' * len(prefix)
         assert (
-            lines[0].startswith(check.prefix) and
-            lines[1].startswith(' ' * len(check.prefix)) and
-            lines[2].startswith(' ' * len(check.prefix)) and
-            lines[3].startswith(' ' * len(check.prefix)))
+            lines[0].startswith(prefix) and
+            lines[1].startswith(prefix_pad) and
+            lines[2].startswith(prefix_pad) and
+            lines[3].startswith(prefix_pad))
 
     def testMultilineValueWrapped(self):
         # Multiline values are line wrapped
         multiline_str = 'line1\nline2'
-        with disable_coloring(), capture_standard_streams() as (out, err):
+        with captured() as (out, err):
             check(multiline_str)
         pair = parse_output_into_pairs(out, err, 2)[0][0]
         assert pair == (
-            'multiline_str', check.argToStringFunction(multiline_str))
+            'multiline_str', self._arg2str(multiline_str))
+
+    def testLineBreaksDecideWrapping(self):
+        # A lone trailing newline keeps a value on one line, while any
+        # other line break, like \r, wraps it
+        def to_string(obj):
+            return obj
+
+        trailing = 'trail\n'
+        carriage = 'line1\rline2'
+        with configure_pychecker_output(argToStringFunction=to_string):
+            assert self._fmt(trailing) == check.prefix + 'trailing: trail\n'
+            assert self._fmt(carriage) == (
+                check.prefix + 'carriage: line1\n' +
+                ' ' * len(check.prefix) + '          line2')
 
     def testIncludeContextSingleLine(self):
         i = 3
         with configure_pychecker_output(includeContext=True):
-            with disable_coloring(), capture_standard_streams() as (out, err):
+            with captured() as (out, err):
                 check(i)
         pair = parse_output_into_pairs(out, err, 1)[0][0]
         assert pair == ('i', '3')
@@ -441,109 +630,79 @@ class TestPyChecker(unittest.TestCase):
     def testContextAbsPathSingleLine(self):
         i = 3
         with configure_pychecker_output(includeContext=True, contextAbsPath=True):
-            with disable_coloring(), capture_standard_streams() as (out, err):
+            with captured() as (out, err):
                 check(i)
         # Output with absolute path can easily exceed line width, so no assert line num here
         pairs = parse_output_into_pairs(out, err, 0)
         assert [('i', '3')] in pairs
 
-    def testValues(self):
-        with disable_coloring(), capture_standard_streams() as (out, err):
-            check(3, 'asdf', "asdf")
-        pairs = parse_output_into_pairs(out, err, 1)
-        assert pairs == [[('3', None), ("'asdf'", None), ("'asdf'", None)]]
-
     def testIncludeContextMultiLine(self):
         multiline_str = 'line1\nline2'
         with configure_pychecker_output(includeContext=True):
-            with disable_coloring(), capture_standard_streams() as (out, err):
+            with captured() as (out, err):
                 check(multiline_str)
-        first_line = err.getvalue().splitlines()[0]
+        first_line = err.splitlines()[0]
         assert line_is_context(first_line)
         pair = parse_output_into_pairs(out, err, 3)[1][0]
         assert pair == (
-            'multiline_str', check.argToStringFunction(multiline_str))
+            'multiline_str', self._arg2str(multiline_str))
 
     def testContextAbsPathMultiLine(self):
         multiline_str = 'line1\nline2'
         with configure_pychecker_output(includeContext=True, contextAbsPath=True):
-            with disable_coloring(), capture_standard_streams() as (out, err):
+            with captured() as (out, err):
                 check(multiline_str)
-        first_line = err.getvalue().splitlines()[0]
+        first_line = err.splitlines()[0]
         assert line_is_abs_path_context(first_line)
         pair = parse_output_into_pairs(out, err, 3)[1][0]
         assert pair == (
-            'multiline_str', check.argToStringFunction(multiline_str))
+            'multiline_str', self._arg2str(multiline_str))
 
     def testFormat(self):
-        with disable_coloring(), capture_standard_streams() as (out, err):
+        with captured() as (out, err):
             """comment"""
             noop()
             check('sup')  # noqa
             noop()  # noqa
         """comment"""
         noop()
-        s = check.format('sup') # noqa
+        s = self._fmt('sup') # noqa
         noop()  # noqa
         assert s == err.getvalue().rstrip()
 
     def testMultilineInvocationWithComments(self):
-        with disable_coloring(), capture_standard_streams() as (out, err):
+        with captured() as (out, err):
             check(a, b)
         pairs = parse_output_into_pairs(out, err, 1)[0]
         assert pairs == [('a', '1'), ('b', '2')]
 
     def testNoSourceAvailable(self):
-        with disable_coloring(), capture_standard_streams() as (out, err):
+        with captured() as (out, err):
             eval('check()')
         assert NoAvailableSourceError.infoMessage in err.getvalue()
 
-    def testSingleTupleArgument(self):
-        with disable_coloring(), capture_standard_streams() as (out, err):
-            check((a, b))
-        pair = parse_output_into_pairs(out, err, 1)[0][0]
-        self.assertEqual(pair, ('(a, b)', '(1, 2)'))
-
     def testMultilineContainerArgs(self):
-        with disable_coloring(), capture_standard_streams() as (out, err):
+        with captured() as (out, err):
             check((a, b))
             check([a, b])
             check((a, b), [list(range(15)), list(range(15))])
-        self.assertEqual(err.getvalue().strip(), """
-        check| (a, b): (1, 2)
-        check| [a, b]: [1, 2]
-        check| (a, b): (1, 2)
-        [list(range(15)), list(range(15))]:
-        [[0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14],
-        [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14]]
-        """.strip())
-        with disable_coloring(), capture_standard_streams() as (out, err):
+        self.assertEqual(err.getvalue().strip(), MULTILINE_CONTAINER_OUTPUT)
+        with captured() as (out, err):
             with configure_pychecker_output(includeContext=True):
                 check((a, b), [list(range(15)), list(range(15))])
         lines = err.getvalue().strip().splitlines()
-        self.assertRegexpMatches(
-            lines[0],
-            r'ic\| test_pychecker.py:\d+ in testMultilineContainerArgs\(\)',
-        )
-        self.assertEqual('\n'.join(lines[1:]), """\
-        (a, b): (1, 2)
-        [list(range(15)), list(range(15))]:
-        [[0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14],
-        [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14]]""")
-
-    def testMultipleTupleArguments(self):
-        with disable_coloring(), capture_standard_streams() as (out, err):
-            check((a, b), (b, a), a, b)
-        pair = parse_output_into_pairs(out, err, 1)[0]
-        self.assertEqual(pair, [
-            ('(a, b)', '(1, 2)'), ('(b, a)', '(2, 1)'), ('a', '1'), ('b', '2')])
+        self.assertRegex(lines[0], MULTILINE_CONTAINER_CONTEXT_RE)
+        self.assertEqual(
+            '\n'.join(lines[1:]), MULTILINE_CONTAINER_OUTPUT_WITH_CONTEXT)
 
     def testColoring(self):
         with capture_standard_streams() as (out, err):
             # Output should be colored with ANSI control codes
             check({1: 'str'})
-        assert has_ansi_escape_codes(err.getvalue())
+        assert err.has_ansi_escape_codes()
 
     def testConfigureOutputWithNoParameters(self):
         with self.assertRaises(TypeError):
-            check.configureOutput()
+            check.configure_output()
+        # Any single argument counts, even one set to its current value.
+        check.configure_output(max_repr_size=check.max_repr_size)